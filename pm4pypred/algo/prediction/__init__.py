@@ -1 +1 @@
-from pm4pypred.algo.prediction import factory, versions
+from pm4pypred.algo.prediction import attributes_selection, factory, trace_times, versions
@@ -0,0 +1,51 @@
+import weakref
+
+from pm4py.algo.filtering.log.attributes import attributes_filter
+
+# attributes selected for each log object, dropped together with the log
+SELECTED_ATTRIBUTES = weakref.WeakKeyDictionary()
+
+
+def select_attributes_from_log_for_tree(log, parameters=None):
+    """
+    Selects the attributes of the log to consider in the representation
+    (see attributes_filter.select_attributes_from_log_for_tree), reusing the selection
+    already done on the same log object (e.g. when several variants are trained on the same log)
+
+    Parameters
+    -------------
+    log
+        Log
+    parameters
+        Possible parameters of the algorithm, including attributes_cache (dictionary to use as cache
+        of the selections, instead of the module-level one)
+
+    Returns
+    -------------
+    str_tr_attr
+        List of string trace attributes
+    str_ev_attr
+        List of string event attributes
+    num_tr_attr
+        List of numeric trace attributes
+    num_ev_attr
+        List of numeric event attributes
+    """
+    if parameters is None:
+        parameters = {}
+    cache = parameters["attributes_cache"] if "attributes_cache" in parameters else SELECTED_ATTRIBUTES
+
+    # the log may not be usable as key of the cache (TypeError), in which case the selection is not cached
+    try:
+        selected_attributes = cache[log] if log in cache else None
+    except TypeError:
+        selected_attributes = None
+    if selected_attributes is None:
+        selected_attributes = attributes_filter.select_attributes_from_log_for_tree(log)
+        try:
+            cache[log] = selected_attributes
+        except TypeError:
+            pass
+
+    # copies, since the callers may extend the lists
+    return tuple(list(attributes) for attributes in selected_attributes)
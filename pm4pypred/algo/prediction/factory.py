@@ -1,4 +1,9 @@
+import os
+import pickle
+import tempfile
+
 import joblib
+from tensorflow.keras.models import load_model
 
 from pm4pypred.algo.prediction.versions import elasticnet, keras_rnn
 
@@ -51,7 +56,52 @@ def test(model, trace, parameters=None):
     return VERSIONS_TEST[variant](model, trace, parameters=parameters)
 
 
-def save(model, filename):
+def write_replacing(filename, write_function):
+    """
+    Writes a file in a temporary file of the same directory, and then replaces the target file with it.
+    Processes that memory-mapped the previous version of the file keep reading it, instead of reading
+    a truncated file
+
+    Parameters
+    -------------
+    filename
+        Name of the file to write
+    write_function
+        Function writing the content in the file whose name is given as argument
+    """
+    directory, basename = os.path.split(os.path.abspath(filename))
+    # the temporary file keeps the extension, since the Keras serializer chooses the format from it
+    fd, temp_filename = tempfile.mkstemp(prefix=basename + ".", suffix=os.path.splitext(basename)[1], dir=directory)
+    os.close(fd)
+    try:
+        write_function(temp_filename)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+def is_compressed(filename):
+    """
+    Checks if a file saved by joblib is compressed
+
+    Parameters
+    -------------
+    filename
+        Name of the file
+
+    Returns
+    -------------
+    boolean
+        True if the file is compressed
+    """
+    with open(filename, "rb") as f:
+        # uncompressed joblib files are pickles, which start with the PROTO opcode
+        return f.read(1) != pickle.PROTO
+
+
+def save(model, filename, compress=False):
     """
     Saves a model
 
@@ -60,12 +110,32 @@ def save(model, filename):
     model
         Prediction model
     filename
-        Name of the file where to save the model
+        Name of the file where to save the model (Keras models are saved in an additional filename + ".h5" file).
+        The files are replaced atomically, so that models memory-mapped from them remain valid
+    compress
+        Compress the saved model with LZ4 (or zlib, if LZ4 is not installed).
+        The model is saved uncompressed by default, since only uncompressed files can be memory-mapped when loading
     """
-    joblib.dump(model, filename, compress=3)
-
-
-def load(filename):
+    if compress:
+        try:
+            import lz4  # noqa: F401
+            compress = ("lz4", 3)
+        except ImportError:
+            compress = ("zlib", 3)
+    model = dict(model)
+    if model["variant"] == KERAS_RNN:
+        # the Keras model is saved with its native serializer, next to the joblib file
+        write_replacing(filename + ".h5", model.pop("regr").save)
+    elif model["variant"] == ELASTICNET:
+        # only the coefficients are needed to predict, not the state of the solver
+        regr = model.pop("regr")
+        model["coef"] = regr.coef_
+        model["intercept"] = regr.intercept_
+    write_replacing(filename, lambda temp_filename: joblib.dump(model, temp_filename, compress=compress,
+                                                                protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load(filename, mmap_mode="r"):
     """
     Loads a model
 
@@ -73,10 +143,22 @@ def load(filename):
     -------------
     filename
         Name of the file where the model is saved
+    mmap_mode
+        Memory-map mode of the arrays contained in the model (None to read them in memory).
+        Memory-mapping is faster and lets several processes share the same arrays,
+        but it applies only to models saved without compression (compressed models are read in memory)
 
     Returns
     -------------
     model
         Prediction model
     """
-    return joblib.load(filename)
+    if mmap_mode is not None and is_compressed(filename):
+        mmap_mode = None
+    model = joblib.load(filename, mmap_mode=mmap_mode)
+    if "regr" not in model:
+        if model["variant"] == KERAS_RNN:
+            model["regr"] = load_model(filename + ".h5")
+        elif model["variant"] == ELASTICNET:
+            model["regr"] = elasticnet.get_regr_from_coefficients(model.pop("coef"), model.pop("intercept"))
+    return model
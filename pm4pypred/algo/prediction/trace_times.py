@@ -0,0 +1,80 @@
+import datetime
+
+import numpy as np
+
+from pm4py.util.business_hours import BusinessHours
+
+
+def get_trace_timestamps(trace, timestamp_key):
+    """
+    Gets the timestamps of the events of the trace as a datetime64 array.
+    Timezone-aware timestamps are converted to UTC, naive timestamps are taken as they are,
+    so that the differences between the timestamps do not depend on the time zone of the host
+
+    Parameters
+    ------------
+    trace
+        Trace
+    timestamp_key
+        Timestamp attribute
+
+    Returns
+    ------------
+    timestamps
+        datetime64 (microseconds) array containing the timestamp of each event of the trace
+    """
+    timestamps = []
+    for event in trace:
+        timestamp = event[timestamp_key]
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        timestamps.append(timestamp)
+    return np.array(timestamps, dtype="datetime64[us]")
+
+
+def get_trace_remaining_seconds(trace, timestamp_key):
+    """
+    Gets, for each event of the trace, the seconds between the event and the last event of the trace
+
+    Parameters
+    ------------
+    trace
+        Trace
+    timestamp_key
+        Timestamp attribute
+
+    Returns
+    ------------
+    remaining
+        Array containing the remaining seconds for each event of the trace
+    """
+    timestamps = get_trace_timestamps(trace, timestamp_key)
+    return (timestamps[-1] - timestamps) / np.timedelta64(1, "s")
+
+
+def trace_business_seconds_prefix(trace, timestamp_key, worktiming, weekends):
+    """
+    Gets, for each event of the trace, the business seconds elapsed since the first event of the trace.
+    The business seconds are computed between consecutive events and accumulated, so that each BusinessHours
+    object spans only the gap between two events
+
+    Parameters
+    ------------
+    trace
+        Trace
+    timestamp_key
+        Timestamp attribute
+    worktiming
+        Begin and end hour of the working day
+    weekends
+        Days of the week that are not worked
+
+    Returns
+    ------------
+    business_seconds
+        Array containing the cumulative business seconds for each event of the trace
+    """
+    timestamps = [event[timestamp_key].replace(tzinfo=None) for event in trace]
+    gaps = [BusinessHours(timestamps[index - 1], timestamps[index], worktiming=worktiming,
+                          weekends=weekends).getseconds() for index in range(1, len(timestamps))]
+    return np.concatenate(([0.0], np.cumsum(gaps, dtype=np.float64)))
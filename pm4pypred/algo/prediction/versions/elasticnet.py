@@ -1,13 +1,30 @@
+import numpy as np
+from scipy import sparse
 from sklearn.linear_model import ElasticNet
 
-from pm4py.algo.filtering.log.attributes import attributes_filter
 from pm4py.objects.log.log import EventLog
 from pm4py.objects.log.util import get_log_representation
 from pm4py.objects.log.util import sorting
 from pm4py.objects.log.util import xes
-from pm4py.objects.log.util.get_prefixes import get_log_with_log_prefixes
 from pm4py.util import constants
-from pm4py.util.business_hours import BusinessHours
+
+from pm4pypred.algo.prediction import attributes_selection, trace_times
+
+try:
+    # working-set solver with dual gap screening, much faster than sklearn on wide one-hot designs
+    from celer import ElasticNet as CelerElasticNet
+except ImportError:
+    CelerElasticNet = None
+
+try:
+    # GPU solver, used for large training sets when a CUDA device is available
+    import cupy
+    from cuml.linear_model import ElasticNet as CumlElasticNet
+
+    if cupy.cuda.runtime.getDeviceCount() == 0:
+        CumlElasticNet = None
+except (ImportError, RuntimeError):
+    CumlElasticNet = None
 
 
 def get_remaining_time_from_log(log, max_len_trace=100000, parameters=None):
@@ -25,34 +42,105 @@ def get_remaining_time_from_log(log, max_len_trace=100000, parameters=None):
 
     Returns
     ------------
-    list
-        List of remaining times
+    y_orig
+        List of arrays (one per trace) containing the remaining times, padded to max_len_trace
     """
     if parameters is None:
         parameters = {}
-    timestamp_key = parameters[
-        constants.PARAMETER_CONSTANT_TIMESTAMP_KEY] if constants.PARAMETER_CONSTANT_TIMESTAMP_KEY in parameters else xes.DEFAULT_TIMESTAMP_KEY
-    business_hours = parameters["business_hours"] if "business_hours" in parameters else False
-    worktiming = parameters["worktiming"] if "worktiming" in parameters else [7, 17]
-    weekends = parameters["weekends"] if "weekends" in parameters else [6, 7]
+    timestamp_key = parameters.get(constants.PARAMETER_CONSTANT_TIMESTAMP_KEY, xes.DEFAULT_TIMESTAMP_KEY)
+    business_hours = parameters.get("business_hours", False)
+    worktiming = parameters.get("worktiming", [7, 17])
+    weekends = parameters.get("weekends", [6, 7])
     y_orig = []
     for trace in log:
-        y_orig.append([])
-        for index, event in enumerate(trace):
-            if index >= max_len_trace:
-                break
-            timestamp_st = trace[index][timestamp_key]
-            timestamp_et = trace[-1][timestamp_key]
-            if business_hours:
-                bh = BusinessHours(timestamp_st.replace(tzinfo=None), timestamp_et.replace(tzinfo=None), worktiming=worktiming, weekends=weekends)
-                y_orig[-1].append(bh.getseconds())
-            else:
-                y_orig[-1].append((timestamp_et - timestamp_st).total_seconds())
-        while len(y_orig[-1]) < max_len_trace:
-            y_orig[-1].append(y_orig[-1][-1])
+        if business_hours:
+            business_seconds = trace_times.trace_business_seconds_prefix(trace, timestamp_key, worktiming, weekends)
+            remaining = business_seconds[-1] - business_seconds[:max_len_trace]
+        else:
+            # single vectorized subtraction over the timestamps of the trace
+            remaining = trace_times.get_trace_remaining_seconds(trace, timestamp_key)[:max_len_trace]
+        y_orig.append(np.pad(remaining, (0, max_len_trace - len(remaining)), mode="edge"))
     return y_orig
 
 
+def stream_prefix_rows(log, str_tr_attr, str_ev_attr, num_tr_attr, num_ev_attr, str_evsucc_attr, parameters=None,
+                       with_remaining_time=True):
+    """
+    Streams, in order, the representation and the remaining time of every prefix of every trace of the log,
+    without materializing the prefixes (the representation of a prefix is obtained updating the one of
+    the previous prefix with the new event)
+
+    Parameters
+    ------------
+    log
+        Log
+    str_tr_attr
+        List of string trace attributes to consider
+    str_ev_attr
+        List of string event attributes to consider
+    num_tr_attr
+        List of numeric trace attributes to consider
+    num_ev_attr
+        List of numeric event attributes to consider
+    str_evsucc_attr
+        List of attributes succession of values to consider
+    parameters
+        Parameters of the algorithm
+    with_remaining_time
+        Computes the remaining time of the prefixes (otherwise, None is yielded in place of it)
+
+    Returns
+    ------------
+    generator
+        Generator of (row, remaining time) couples, where row is a dictionary associating to each feature
+        of the prefix its value. Features are keyed by (group, attribute index, feature name), so that sorting the keys
+        gives the same order of the features as get_log_representation.get_representation
+    """
+    for trace in log:
+        if not trace:
+            continue
+        if with_remaining_time:
+            remaining_time = get_remaining_time_from_log([trace], max_len_trace=len(trace), parameters=parameters)[0]
+        else:
+            remaining_time = [None] * len(trace)
+        trace_row = {}
+        for index, attribute in enumerate(str_tr_attr):
+            trace_row[(0, index, get_log_representation.get_string_trace_attribute_rep(trace, attribute))] = 1
+        for index, attribute in enumerate(num_tr_attr):
+            trace_row[(2, index, get_log_representation.get_numeric_trace_attribute_rep(attribute))] = \
+                get_log_representation.get_numeric_trace_attribute_value(trace, attribute)
+        ev_values = [set() for attribute in str_ev_attr]
+        num_ev_values = [None] * len(num_ev_attr)
+        succ_values = [set() for attribute in str_evsucc_attr]
+        for event_index, event in enumerate(trace):
+            for index, attribute in enumerate(str_ev_attr):
+                if attribute in event:
+                    ev_values[index].add(get_log_representation.get_string_event_attribute_rep(event, attribute))
+            for index, attribute in enumerate(num_ev_attr):
+                if attribute in event:
+                    num_ev_values[index] = event[attribute]
+            if event_index > 0:
+                previous_event = trace[event_index - 1]
+                for index, attribute in enumerate(str_evsucc_attr):
+                    if attribute in previous_event and attribute in event:
+                        succ_values[index].add(
+                            get_log_representation.get_string_event_attribute_succession_rep(previous_event, event,
+                                                                                              attribute))
+            row = dict(trace_row)
+            for index, attribute in enumerate(str_ev_attr):
+                for value in ev_values[index] or ["event:" + str(attribute) + "@UNDEFINED"]:
+                    row[(1, index, value)] = 1
+            for index, attribute in enumerate(num_ev_attr):
+                if num_ev_values[index] is None:
+                    raise Exception("at least a trace without any event with event attribute: " + attribute)
+                row[(3, index, get_log_representation.get_numeric_event_attribute_rep(attribute))] = num_ev_values[
+                    index]
+            for index, attribute in enumerate(str_evsucc_attr):
+                for value in succ_values[index] or ["succession:" + str(attribute) + "@UNDEFINED"]:
+                    row[(4, index, value)] = 1
+            yield row, remaining_time[event_index]
+
+
 def train(log, parameters=None):
     """
     Train the prediction model
@@ -62,7 +150,9 @@ def train(log, parameters=None):
     log
         Event log
     parameters
-        Possible parameters of the algorithm
+        Possible parameters of the algorithm, including y_orig (remaining times as returned by
+        get_remaining_time_from_log on the given log, i.e. one row per trace in the order of the log,
+        padded to the maximum length of the traces)
 
     Returns
     ------------
@@ -77,13 +167,14 @@ def train(log, parameters=None):
         constants.PARAMETER_CONSTANT_ACTIVITY_KEY] if constants.PARAMETER_CONSTANT_ACTIVITY_KEY in parameters else xes.DEFAULT_NAME_KEY
     timestamp_key = parameters[
         constants.PARAMETER_CONSTANT_TIMESTAMP_KEY] if constants.PARAMETER_CONSTANT_TIMESTAMP_KEY in parameters else xes.DEFAULT_TIMESTAMP_KEY
-    business_hours = parameters["business_hours"] if "business_hours" in parameters else False
-    worktiming = parameters["worktiming"] if "worktiming" in parameters else [7, 17]
-    weekends = parameters["weekends"] if "weekends" in parameters else [6, 7]
 
     y_orig = parameters["y_orig"] if "y_orig" in parameters else None
-
-    log = sorting.sort_timestamp(log, timestamp_key)
+    # cuML is slow on small problems, so the GPU is used only above this number of prefixes
+    gpu_min_rows = parameters["gpu_min_rows"] if "gpu_min_rows" in parameters else 50000
+    # cuML needs the dense design matrix, built in host memory before the copy to the device
+    gpu_max_bytes = parameters["gpu_max_bytes"] if "gpu_max_bytes" in parameters else 2 ** 31
+    # seed of the random coordinate selection of sklearn, so that the fit is deterministic
+    random_state = parameters["random_state"] if "random_state" in parameters else 0
 
     str_evsucc_attr = [activity_key]
     if "str_ev_attr" in parameters:
@@ -92,53 +183,97 @@ def train(log, parameters=None):
         num_tr_attr = parameters["num_tr_attr"] if "num_tr_attr" in parameters else []
         num_ev_attr = parameters["num_ev_attr"] if "num_ev_attr" in parameters else []
     else:
-        str_tr_attr, str_ev_attr, num_tr_attr, num_ev_attr = attributes_filter.select_attributes_from_log_for_tree(log)
+        str_tr_attr, str_ev_attr, num_tr_attr, num_ev_attr = attributes_selection.select_attributes_from_log_for_tree(
+            log, parameters=parameters)
         if activity_key not in str_ev_attr:
             str_ev_attr.append(activity_key)
 
-    max_trace_length = max(len(x) for x in log)
+    if y_orig is not None:
+        # the sorted log contains the non-empty traces ordered by their first timestamp: the rows of y_orig
+        # are reordered in the same way, and trimmed to the length of their trace (one target per prefix)
+        order = sorted([index for index, trace in enumerate(log) if len(trace) > 0],
+                       key=lambda index: min(event[timestamp_key] for event in log[index]))
+        y_orig = [y_orig[index][:len(log[index])] for index in order]
 
-    if max_trace_length == 1:
-        # this you shall use
-        data, feature_names = get_log_representation.get_representation(log, str_tr_attr, str_ev_attr, num_tr_attr,
-                                                                        num_ev_attr, str_evsucc_attr=str_evsucc_attr)
-        ext_log = log
-    else:
-        ext_log, change_indexes = get_log_with_log_prefixes(log)
-        data, feature_names = get_log_representation.get_representation(ext_log, str_tr_attr, str_ev_attr, num_tr_attr,
-                                                                        num_ev_attr, str_evsucc_attr=str_evsucc_attr)
+    log = sorting.sort_timestamp(log, timestamp_key)
+
+    # single pass over the prefixes, accumulating the one-hot representation as (row, column, value) triplets
+    columns = {}
+    rows_idx = []
+    cols_idx = []
+    values = []
+    remaining_time = []
+    for row_index, (row, rem_time) in enumerate(
+            stream_prefix_rows(log, str_tr_attr, str_ev_attr, num_tr_attr, num_ev_attr, str_evsucc_attr,
+                               parameters=parameters, with_remaining_time=y_orig is None)):
+        for feature, value in row.items():
+            rows_idx.append(row_index)
+            cols_idx.append(columns.setdefault(feature, len(columns)))
+            values.append(value)
+        remaining_time.append(rem_time)
+    sorted_features = sorted(columns)
+    feature_names = [feature[2] for feature in sorted_features]
+    # columns are numbered in order of appearance, move them to the position of the feature in feature_names
+    position = np.empty(len(columns), dtype=np.int64)
+    position[[columns[feature] for feature in sorted_features]] = np.arange(len(columns))
+    data = sparse.coo_matrix((np.asarray(values, dtype=np.float64), (rows_idx, position[cols_idx])),
+                             shape=(len(remaining_time), len(feature_names))).tocsr()
 
     if y_orig is not None:
         remaining_time = [y for x in y_orig for y in x]
+        if len(remaining_time) != data.shape[0]:
+            raise Exception("y_orig does not contain a remaining time for each event of the log")
+    # size in bytes of the dense float32 design matrix
+    dense_bytes = data.shape[0] * data.shape[1] * np.dtype(np.float32).itemsize
+    if CumlElasticNet is not None and data.shape[0] > gpu_min_rows and dense_bytes <= gpu_max_bytes and \
+            dense_bytes <= cupy.cuda.Device().mem_info[0]:
+        # cuML needs dense data; the fitted coefficients are copied in a CPU regressor,
+        # so that the model does not depend on the device
+        regr = CumlElasticNet(l1_ratio=0.7, max_iter=10000, tol=1e-4, output_type="numpy")
+        regr.fit(cupy.asarray(data.astype(np.float32).toarray()),
+                 cupy.asarray(np.asarray(remaining_time, dtype=np.float32)))
+        regr = get_regr_from_coefficients(np.asarray(regr.coef_, dtype=np.float64), float(regr.intercept_))
+    elif CelerElasticNet is not None:
+        # celer works column-wise, hence it prefers the CSC format
+        data = sparse.csc_matrix(data)
+        regr = CelerElasticNet(l1_ratio=0.7, tol=1e-4)
+        regr.fit(data, remaining_time)
     else:
-        if business_hours:
-            remaining_time = []
-            for trace in ext_log:
-                if trace:
-                    timestamp_et = trace[-1][timestamp_key]
-                    timestamp_st = trace[0][timestamp_key]
-
-                    bh = BusinessHours(timestamp_st.replace(tzinfo=None), timestamp_et.replace(tzinfo=None),
-                                       worktiming=worktiming, weekends=weekends)
-                    remaining_time.append(bh.getseconds())
-                else:
-                    remaining_time.append(0)
-        else:
-            remaining_time = []
-            for trace in ext_log:
-                if trace:
-                    remaining_time.append((trace[-1][timestamp_key] - trace[0][timestamp_key]).total_seconds())
-                else:
-                    remaining_time.append(0)
-    regr = ElasticNet(max_iter=10000, l1_ratio=0.7)
-    print(data)
-    regr.fit(data, remaining_time)
+        # sklearn fits sparse data in the CSC format: converting it here avoids a further copy in fit,
+        # since data is not used after the fit
+        data = sparse.csc_matrix(data)
+        regr = ElasticNet(max_iter=10000, l1_ratio=0.7, copy_X=False, selection="random", tol=1e-4,
+                          random_state=random_state)
+        regr.fit(data, remaining_time)
 
     return {"str_tr_attr": str_tr_attr, "str_ev_attr": str_ev_attr, "num_tr_attr": num_tr_attr,
             "num_ev_attr": num_ev_attr, "str_evsucc_attr": str_evsucc_attr, "feature_names": feature_names,
             "remaining_time": remaining_time, "regr": regr, "variant": "elasticnet"}
 
 
+def get_regr_from_coefficients(coef, intercept):
+    """
+    Rebuilds a fitted regressor from its coefficients
+
+    Parameters
+    ------------
+    coef
+        Coefficients of the features
+    intercept
+        Intercept
+
+    Returns
+    ------------
+    regr
+        Regressor that can be used for prediction
+    """
+    regr = ElasticNet(l1_ratio=0.7)
+    regr.coef_ = coef
+    regr.intercept_ = intercept
+    regr.n_features_in_ = len(coef)
+    return regr
+
+
 def test(model, obj, parameters=None):
     """
     Test the prediction model
@@ -1,20 +1,151 @@
 import math
-from copy import deepcopy
 
 import numpy as np
-from keras.layers.core import Dense, Activation
-from keras.layers.recurrent import LSTM
-from keras.models import Sequential
+import tensorflow as tf
+from joblib import Parallel, delayed
+from tensorflow.keras.layers import Dense, Embedding, LSTM, Reshape
+from tensorflow.keras.models import Sequential
 
-from pm4py.algo.filtering.log.attributes import attributes_filter
 from pm4py.objects.log.log import EventLog
 from pm4py.objects.log.util import get_log_representation
 from pm4py.objects.log.util import xes
 from pm4py.util import constants
-from pm4py.util.business_hours import BusinessHours
 
+from pm4pypred.algo.prediction import attributes_selection, trace_times
 
-def get_trace_rep_rnn(trace, dictionary_features, max_len_trace):
+# below this number of traces, the log is represented sequentially even when more threads are requested
+PARALLEL_MIN_TRACES = 1000
+
+
+def get_feature_name_splits(feature_name, separators):
+    """
+    Gets all the possible ways to split a feature name into values using the given separators in order
+    (values may contain the separators themselves, so there may be more than one)
+
+    Parameters
+    ------------
+    feature_name
+        Feature name (without the event:/succession: prefix)
+    separators
+        Separators between the values, in order
+
+    Returns
+    ------------
+    splits
+        List of tuples of values that, joined by the separators, give back the feature name
+    """
+    if not separators:
+        return [(feature_name,)]
+    splits = []
+    position = feature_name.find(separators[0])
+    while position >= 0:
+        for rest in get_feature_name_splits(feature_name[position + 1:], separators[1:]):
+            splits.append((feature_name[:position],) + rest)
+        position = feature_name.find(separators[0], position + 1)
+    return splits
+
+
+def get_feature_names(log, str_tr_attr, str_ev_attr, num_tr_attr, num_ev_attr, str_evsucc_attr):
+    """
+    Gets the names of the features of the log, in the same order as get_log_representation.get_representation,
+    without building the (dense) representation of the log
+
+    Parameters
+    ------------
+    log
+        Log
+    str_tr_attr
+        List of string trace attributes to consider
+    str_ev_attr
+        List of string event attributes to consider
+    num_tr_attr
+        List of numeric trace attributes to consider
+    num_ev_attr
+        List of numeric event attributes to consider
+    str_evsucc_attr
+        List of attributes succession of values to consider
+
+    Returns
+    ------------
+    feature_names
+        Names of the features, in order
+    """
+    feature_names = []
+    for trace_attribute in str_tr_attr:
+        feature_names.extend(get_log_representation.get_all_string_trace_attribute_values(log, trace_attribute))
+    for event_attribute in str_ev_attr:
+        feature_names.extend(get_log_representation.get_all_string_event_attribute_values(log, event_attribute))
+    for trace_attribute in num_tr_attr:
+        feature_names.append(get_log_representation.get_numeric_trace_attribute_rep(trace_attribute))
+    for event_attribute in num_ev_attr:
+        feature_names.append(get_log_representation.get_numeric_event_attribute_rep(event_attribute))
+    for event_attribute in str_evsucc_attr:
+        feature_names.extend(
+            get_log_representation.get_all_string_event_succession_attribute_values(log, event_attribute))
+    return feature_names
+
+
+def get_features_encoding(dictionary_features):
+    """
+    Gets an integer encoding of the event and succession features, so that the featurization does not need
+    to build the feature names.
+    Each distinct value of an attribute gets an integer identifier (starting from 1), and the features are keyed
+    by a single integer packing the identifiers of the attribute and of its value(s):
+    (attribute_id << 2 * value_bits) | (value1_id << value_bits) | value2_id, with value2_id = 0 for event features.
+    Each event may activate at most one feature per attribute (and one succession feature per attribute),
+    so every attribute is given its own slot in the representation of the event
+
+    Parameters
+    ------------
+    dictionary_features
+        Ordered dictionary of features
+
+    Returns
+    ------------
+    features_encoding
+        Dictionary containing:
+            attributes -> associates to each attribute its identifier and the identifiers of its values
+            value_bits -> number of bits used to pack the identifier of a value
+            keys -> sorted array of the packed keys of the features
+            slots -> slot of the feature associated to each key
+            indexes -> index + 1 of the feature associated to each key
+            n_slots -> number of slots of the representation of an event
+    """
+    ev_features = []
+    succ_features = []
+    for feature_name, index in dictionary_features.items():
+        if feature_name.startswith("event:"):
+            for key in get_feature_name_splits(feature_name[len("event:"):], ("@",)):
+                ev_features.append((key, index + 1))
+        elif feature_name.startswith("succession:"):
+            for key in get_feature_name_splits(feature_name[len("succession:"):], ("@", "#")):
+                succ_features.append((key, index + 1))
+    attributes = {}
+    for key, index in ev_features + succ_features:
+        value_ids = attributes.setdefault(key[0], (len(attributes), {}))[1]
+        for value in key[1:]:
+            value_ids.setdefault(value, len(value_ids) + 1)
+    value_bits = max([len(value_ids) for attribute_id, value_ids in attributes.values()] + [0]).bit_length()
+    ev_slots = {}
+    succ_slots = {}
+    features = {}
+    for key, index in ev_features:
+        attribute_id, value_ids = attributes[key[0]]
+        packed = (attribute_id << 2 * value_bits) | (value_ids[key[1]] << value_bits)
+        features[packed] = (ev_slots.setdefault(key[0], len(ev_slots)), index)
+    for key, index in succ_features:
+        attribute_id, value_ids = attributes[key[0]]
+        packed = (attribute_id << 2 * value_bits) | (value_ids[key[1]] << value_bits) | value_ids[key[2]]
+        # the succession slots follow the event ones
+        features[packed] = (len(ev_slots) + succ_slots.setdefault(key[0], len(succ_slots)), index)
+    keys = sorted(features)
+    return {"attributes": attributes, "value_bits": value_bits, "keys": np.array(keys, dtype=np.int64),
+            "slots": np.array([features[key][0] for key in keys], dtype=np.int64),
+            "indexes": np.array([features[key][1] for key in keys], dtype=np.int32),
+            "n_slots": len(ev_slots) + len(succ_slots)}
+
+
+def get_trace_rep_rnn(trace, features_encoding, max_len_trace):
     """
     Gets a trace representation for RNN training
 
@@ -22,48 +153,57 @@ def get_trace_rep_rnn(trace, dictionary_features, max_len_trace):
     ------------
     trace
         Trace
-    dictionary_features
-        Ordered dictionary of features
+    features_encoding
+        Integer encoding of the features (see get_features_encoding)
     max_len_trace
         Maximum length of the trace in the log
 
     Returns
     ------------
     X
-        double list that contains the value for each feature for each event of the trace
+        int32 matrix (max_len_trace x n_slots) that contains, for each event of the trace, the index + 1
+        of the features that are active in the event (0 for padding)
     """
-    X = []
-    for index in range(min(len(trace), max_len_trace)):
-        event = trace[index]
-        ev_vector = [0] * len(dictionary_features)
-        for attribute_name in event:
-            attribute_value = event[attribute_name]
-            rep = "event:" + str(attribute_name) + "@" + str(attribute_value)
-            if rep in dictionary_features:
-                ev_vector[dictionary_features[rep]] = 1
-        if index < len(trace) - 1:
-            next_event = trace[index + 1]
-            for attribute_name in event:
-                if attribute_name in next_event:
-                    attribute_value_1 = event[attribute_name]
-                    attribute_value_2 = next_event[attribute_name]
-                    rep = "succession:" + str(attribute_name) + "@" + str(attribute_value_1) + "#" + str(
-                        attribute_value_2)
-                    if rep in dictionary_features:
-                        ev_vector[dictionary_features[rep]] = 1
-        X.append(ev_vector)
-    j = len(trace)
-    while j < max_len_trace:
-        # print(X[-1])
-        X.append(np.zeros(len(X[-1])))
-        j = j + 1
-    X = np.transpose(np.asmatrix(X))
-    X = X.tolist()
+    attributes = features_encoding["attributes"]
+    value_bits = features_encoding["value_bits"]
+    keys = features_encoding["keys"]
+    X = np.zeros((max_len_trace, features_encoding["n_slots"]), dtype=np.int32)
+    length = min(len(trace), max_len_trace)
+    # the successions of the last considered event involve the event that follows it
+    events = trace[:length + 1]
+    n_successions = min(length, len(events) - 1)
+    attribute_names = set()
+    for event in events[:length]:
+        attribute_names.update(event)
+    rows = []
+    queries = []
+    for attribute_name in attribute_names:
+        if attribute_name not in attributes:
+            continue
+        attribute_id, value_ids = attributes[attribute_name]
+        # identifiers of the values of the attribute across the events of the trace
+        # (0 where the attribute is missing or its value is not associated to any feature)
+        ids = np.array([value_ids.get(str(event[attribute_name]), 0) if attribute_name in event else 0
+                        for event in events], dtype=np.int64)
+        base = attribute_id << 2 * value_bits
+        ev_rows = np.nonzero(ids[:length])[0]
+        rows.append(ev_rows)
+        queries.append(base | (ids[ev_rows] << value_bits))
+        succ_rows = np.nonzero((ids[:n_successions] > 0) & (ids[1:n_successions + 1] > 0))[0]
+        rows.append(succ_rows)
+        queries.append(base | (ids[succ_rows] << value_bits) | ids[succ_rows + 1])
+    if queries and len(keys) > 0:
+        rows = np.concatenate(rows)
+        queries = np.concatenate(queries)
+        positions = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+        found = keys[positions] == queries
+        X[rows[found], features_encoding["slots"][positions[found]]] = features_encoding["indexes"][
+            positions[found]]
 
     return X
 
 
-def get_log_rep_rnn(log, dictionary_features, max_len_trace):
+def get_log_rep_rnn(log, features_encoding, max_len_trace, parallel=None):
     """
     Gets a log representation for RNN training
 
@@ -71,26 +211,29 @@ def get_log_rep_rnn(log, dictionary_features, max_len_trace):
     -------------
     log
         Log
-    dictionary_features
-        Ordered dictionary of features
+    features_encoding
+        Integer encoding of the features (see get_features_encoding)
     max_len_trace
         Maximum length of the trace in the log
+    parallel
+        (If provided) joblib Parallel context, using threads, in which the traces of large logs are represented
+        (threads share the encoding of the features without copying it). Otherwise, the traces are represented
+        sequentially
 
     Returns
     -------------
     X
-        triple list that describes the log
+        int32 tensor (number of traces x max_len_trace x n_slots) that describes the log
     """
-    X = []
-    for trace in log:
-        rep = get_trace_rep_rnn(trace, dictionary_features, max_len_trace)
-        if rep:
-            X.append(rep)
-
-    return X
+    if not log:
+        return np.zeros((0, max_len_trace, features_encoding["n_slots"]), dtype=np.int32)
+    if parallel is None or parallel.n_jobs == 1 or len(log) < PARALLEL_MIN_TRACES:
+        return np.stack([get_trace_rep_rnn(trace, features_encoding, max_len_trace) for trace in log], axis=0)
+    return np.stack(parallel(delayed(get_trace_rep_rnn)(trace, features_encoding, max_len_trace) for trace in log),
+                    axis=0)
 
 
-def get_X_from_log(log, feature_names, max_len_trace):
+def get_X_from_log(log, feature_names, max_len_trace, features_encoding=None, n_jobs=1):
     """
     Gets the eventual X matrix for a given log
 
@@ -102,21 +245,65 @@ def get_X_from_log(log, feature_names, max_len_trace):
         List of features contained in the log
     max_len_trace
         Maximum length of the trace in the log
+    features_encoding
+        (If provided) Integer encoding of the features, otherwise it is computed from the feature names
+    n_jobs
+        Number of threads used to represent the traces of large logs (-1 to use all the cores)
 
     Returns
     -------------
     X
         3D matrix that describes the log
     """
-    dictionary_features = {}
-    for index, value in enumerate(feature_names):
-        dictionary_features[value] = index
-    X = get_log_rep_rnn(log, dictionary_features, max_len_trace)
-    X = np.array(X)
+    if features_encoding is None:
+        dictionary_features = {}
+        for index, value in enumerate(feature_names):
+            dictionary_features[value] = index
+        features_encoding = get_features_encoding(dictionary_features)
+    if n_jobs != 1 and len(log) >= PARALLEL_MIN_TRACES:
+        with Parallel(n_jobs=n_jobs, prefer="threads") as parallel:
+            X = get_log_rep_rnn(log, features_encoding, max_len_trace, parallel=parallel)
+    else:
+        X = get_log_rep_rnn(log, features_encoding, max_len_trace)
 
     return X
 
 
+def get_dataset_from_log(log, features_encoding, max_len_trace, y, batch_size, shuffle=True, parallel=None):
+    """
+    Gets a dataset of mini-batches of the representation of the log.
+    The representation is built once (the integer encoding of the log is small), and the traces are
+    shuffled at every iteration over the dataset (i.e. at every epoch)
+
+    Parameters
+    -------------
+    log
+        Log
+    features_encoding
+        Integer encoding of the features (see get_features_encoding)
+    max_len_trace
+        Maximum length of the trace in the log
+    y
+        Target values (one row per trace of the log)
+    batch_size
+        Number of traces per mini-batch
+    shuffle
+        Shuffle the traces at every epoch
+    parallel
+        (If provided) joblib Parallel context in which the traces are represented (see get_log_rep_rnn)
+
+    Returns
+    -------------
+    dataset
+        Dataset of (X, y) mini-batches
+    """
+    X = get_log_rep_rnn(log, features_encoding, max_len_trace, parallel=parallel)
+    dataset = tf.data.Dataset.from_tensor_slices((X, np.asarray(y, dtype=np.float64)))
+    if shuffle and len(log) > 0:
+        dataset = dataset.shuffle(len(log), reshuffle_each_iteration=True)
+    return dataset.batch(batch_size)
+
+
 def group_remaining_time(change_indexes, remaining_time, max_len_trace):
     """
     Groups the remaining time of the extended log according to the change indexes
@@ -133,24 +320,16 @@ def group_remaining_time(change_indexes, remaining_time, max_len_trace):
     Returns
     -------------
     rem_time_grouped
-        Remaining time grouped by case
+        Remaining time grouped by case (one row of max_len_trace values per case)
     """
-    rem_time_grouped = []
-    j = 0
-    for ct in change_indexes:
-        rem = []
-        added = False
-
-        for i in range(len(ct)):
-            rem.append(remaining_time[j])
-            if i == max_len_trace - 1:
-                rem_time_grouped.append(deepcopy(rem))
-                added = True
-            elif i == len(ct) - 1 and not added:
-                while len(rem) < max_len_trace:
-                    rem.append(rem[-1])
-                rem_time_grouped.append(deepcopy(rem))
-            j = j + 1
+    lengths = np.array([len(ct) for ct in change_indexes], dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    # cases without events do not contribute any row
+    offsets = offsets[lengths > 0]
+    lengths = lengths[lengths > 0]
+    # for each case, take the first max_len_trace values and repeat the last one until max_len_trace
+    positions = np.minimum(np.arange(max_len_trace)[np.newaxis, :], lengths[:, np.newaxis] - 1)
+    rem_time_grouped = np.asarray(remaining_time, dtype=np.float64)[offsets[:, np.newaxis] + positions]
     return rem_time_grouped
 
 
@@ -166,19 +345,16 @@ def normalize_remaining_time(rem_time_grouped):
     Returns
     -------------
     normalized_rem_time
-        Normalized remaining time
+        Normalized remaining time (-1 everywhere if all the remaining times are 0)
+    log_max_value
+        Logarithm of the maximum value
     """
-    ret = []
-    max_value = -10000000
-    for lst in rem_time_grouped:
-        max_lst = max(lst)
-        max_value = max(max_value, max_lst)
-    log_max_value = math.log(1.0 + max_value)
-    for lst in rem_time_grouped:
-        ret.append([])
-        for val in lst:
-            ret[-1].append(-1.0 + 2.0 * (math.log(val + 1.0) / log_max_value))
-    return ret, log_max_value
+    rem_time_grouped = np.asarray(rem_time_grouped, dtype=np.float64)
+    log_max_value = float(np.log1p(rem_time_grouped.max()))
+    if log_max_value == 0:
+        # all the remaining times are 0: the target is constant, and any prediction is reconstructed as 0
+        return np.full(rem_time_grouped.shape, -1.0), log_max_value
+    return -1.0 + 2.0 * np.log1p(rem_time_grouped) / log_max_value, log_max_value
 
 
 def reconstruct_value(y, log_max_value):
@@ -202,6 +378,25 @@ def reconstruct_value(y, log_max_value):
     return math.exp((y + 1.0) / 2.0 * log_max_value) - 1
 
 
+def reconstruct_value_vec(y, log_max_value):
+    """
+    Reconstruct the values to return in test phase (vectorized version of reconstruct_value)
+
+    Parameters
+    -------------
+    y
+        Array of logarithmic values predicted by the algorithm
+    log_max_value
+        Logarithm of the maximum value
+
+    Returns
+    -------------
+    rec_values
+        Array of reconstructed values
+    """
+    return np.expm1((np.clip(y, -1, None) + 1.0) / 2.0 * log_max_value)
+
+
 def get_remaining_time_from_log(log, max_len_trace=100000, parameters=None):
     """
     Gets the remaining time for the instances given a log and a trace index
@@ -217,31 +412,24 @@ def get_remaining_time_from_log(log, max_len_trace=100000, parameters=None):
 
     Returns
     ------------
-    list
-        List of remaining times
+    y_orig
+        List of arrays (one per trace) containing the remaining times, padded to max_len_trace
     """
     if parameters is None:
         parameters = {}
-    timestamp_key = parameters[
-        constants.PARAMETER_CONSTANT_TIMESTAMP_KEY] if constants.PARAMETER_CONSTANT_TIMESTAMP_KEY in parameters else xes.DEFAULT_TIMESTAMP_KEY
-    business_hours = parameters["business_hours"] if "business_hours" in parameters else False
-    worktiming = parameters["worktiming"] if "worktiming" in parameters else [7, 17]
-    weekends = parameters["weekends"] if "weekends" in parameters else [6, 7]
+    timestamp_key = parameters.get(constants.PARAMETER_CONSTANT_TIMESTAMP_KEY, xes.DEFAULT_TIMESTAMP_KEY)
+    business_hours = parameters.get("business_hours", False)
+    worktiming = parameters.get("worktiming", [7, 17])
+    weekends = parameters.get("weekends", [6, 7])
     y_orig = []
     for trace in log:
-        y_orig.append([])
-        for index, event in enumerate(trace):
-            if index >= max_len_trace:
-                break
-            timestamp_st = trace[index][timestamp_key]
-            timestamp_et = trace[-1][timestamp_key]
-            if business_hours:
-                bh = BusinessHours(timestamp_st.replace(tzinfo=None), timestamp_et.replace(tzinfo=None), worktiming=worktiming, weekends=weekends)
-                y_orig[-1].append(bh.getseconds())
-            else:
-                y_orig[-1].append((timestamp_et - timestamp_st).total_seconds())
-        while len(y_orig[-1]) < max_len_trace:
-            y_orig[-1].append(y_orig[-1][-1])
+        if business_hours:
+            business_seconds = trace_times.trace_business_seconds_prefix(trace, timestamp_key, worktiming, weekends)
+            remaining = business_seconds[-1] - business_seconds[:max_len_trace]
+        else:
+            # single vectorized subtraction over the timestamps of the trace
+            remaining = trace_times.get_trace_remaining_seconds(trace, timestamp_key)[:max_len_trace]
+        y_orig.append(np.pad(remaining, (0, max_len_trace - len(remaining)), mode="edge"))
     return y_orig
 
 
@@ -254,11 +442,20 @@ def train(log, parameters=None):
     log
         Log
     parameters
-        Possible parameters of the algorithm, including default_epochs
+        Possible parameters of the algorithm, including default_epochs, embedding_size (size of the embedding
+        of each feature), jit_compile (XLA compilation of the training step, enabled by default),
+        mixed_precision (float16 computations in the LSTM layer, enabled by default when a GPU is available)
+        and n_jobs (number of threads used to represent the traces of large logs, 1 by default)
     """
     if parameters is None:
         parameters = {}
     default_epochs = parameters["default_epochs"] if "default_epochs" in parameters else 50
+    embedding_size = parameters["embedding_size"] if "embedding_size" in parameters else 16
+    jit_compile = parameters["jit_compile"] if "jit_compile" in parameters else True
+    n_jobs = parameters["n_jobs"] if "n_jobs" in parameters else 1
+    # mixed precision pays off only on GPUs
+    mixed_precision = parameters["mixed_precision"] if "mixed_precision" in parameters else bool(
+        tf.config.list_physical_devices("GPU"))
     parameters["enable_sort"] = False
     activity_key = parameters[
         constants.PARAMETER_CONSTANT_ACTIVITY_KEY] if constants.PARAMETER_CONSTANT_ACTIVITY_KEY in parameters else xes.DEFAULT_NAME_KEY
@@ -268,7 +465,6 @@ def train(log, parameters=None):
                                                                                              max_len_trace=max_len_trace,
                                                                                              parameters=parameters)
     y, log_max_value = normalize_remaining_time(y_orig)
-    y = np.array(y)
     str_evsucc_attr = [activity_key]
     if "str_ev_attr" in parameters:
         str_tr_attr = parameters["str_tr_attr"] if "str_tr_attr" in parameters else []
@@ -276,25 +472,48 @@ def train(log, parameters=None):
         num_tr_attr = parameters["num_tr_attr"] if "num_tr_attr" in parameters else []
         num_ev_attr = parameters["num_ev_attr"] if "num_ev_attr" in parameters else []
     else:
-        str_tr_attr, str_ev_attr, num_tr_attr, num_ev_attr = attributes_filter.select_attributes_from_log_for_tree(log)
+        str_tr_attr, str_ev_attr, num_tr_attr, num_ev_attr = attributes_selection.select_attributes_from_log_for_tree(
+            log, parameters=parameters)
         if activity_key not in str_ev_attr:
             str_ev_attr.append(activity_key)
 
-    data, feature_names = get_log_representation.get_representation(log, str_tr_attr, str_ev_attr, num_tr_attr,
-                                                                    num_ev_attr, str_evsucc_attr=str_evsucc_attr)
-    X = get_X_from_log(log, feature_names, max_len_trace)
-    in_out_neurons = X.shape[2]
+    feature_names = get_feature_names(log, str_tr_attr, str_ev_attr, num_tr_attr, num_ev_attr, str_evsucc_attr)
+    dictionary_features = {}
+    for index, value in enumerate(feature_names):
+        dictionary_features[value] = index
+    features_encoding = get_features_encoding(dictionary_features)
+    n_slots = features_encoding["n_slots"]
+    in_out_neurons = max_len_trace
     hidden_neurons = min(int(in_out_neurons * 7.5), 50)
-    input_shape = (X.shape[1], X.shape[2])
+    input_shape = (max_len_trace, n_slots)
+    batch_size = min(128, len(log))
+    # the last 20% of the traces are kept for validation
+    split_index = int(len(log) * 0.8)
+    # the same pool of threads represents both the training and the validation traces
+    with Parallel(n_jobs=n_jobs, prefer="threads") as parallel:
+        train_dataset = get_dataset_from_log(log[:split_index], features_encoding, max_len_trace, y[:split_index],
+                                             batch_size, parallel=parallel)
+        validation_dataset = get_dataset_from_log(log[split_index:], features_encoding, max_len_trace,
+                                                  y[split_index:], batch_size, shuffle=False, parallel=parallel)
     model = Sequential()
-    model.add(LSTM(hidden_neurons, return_sequences=False, input_shape=input_shape))
-    model.add(Dense(in_out_neurons))
-    model.add(Activation("linear"))
-    model.compile(loss="mean_squared_error", optimizer="rmsprop")
-    model.fit(X, y, batch_size=X.shape[1], nb_epoch=default_epochs, validation_split=0.2)
+    # the embedding of the active features replaces the product between the one-hot vector and the input weights
+    # (index 0, used for padding, has its own embedding)
+    model.add(Embedding(len(feature_names) + 1, embedding_size, input_shape=input_shape))
+    model.add(Reshape((max_len_trace, n_slots * embedding_size)))
+    model.add(LSTM(hidden_neurons, return_sequences=False,
+                   dtype="mixed_float16" if mixed_precision else "float32"))
+    # the output layer is kept in float32 for the numerical stability of the loss
+    model.add(Dense(in_out_neurons, dtype="float32"))
+    optimizer = tf.keras.optimizers.Adam(1e-3)
+    if mixed_precision:
+        # the policy is set on the layers and not globally, so loss scaling has to be enabled explicitly
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+    # XLA fuses the output layer with the loss and its gradient
+    model.compile(loss=tf.keras.losses.MeanSquaredError(), optimizer=optimizer, jit_compile=jit_compile)
+    model.fit(train_dataset, epochs=default_epochs, validation_data=validation_dataset)
     return {"str_tr_attr": str_tr_attr, "str_ev_attr": str_ev_attr, "num_tr_attr": num_tr_attr,
             "num_ev_attr": num_ev_attr, "str_evsucc_attr": str_evsucc_attr, "feature_names": feature_names,
-            "regr": model, "max_len_trace": max_len_trace,
+            "features_encoding": features_encoding, "regr": model, "max_len_trace": max_len_trace,
             "log_max_value": log_max_value, "variant": "keras_rnn"}
 
 
@@ -309,7 +528,8 @@ def test(model, obj, parameters=None):
     obj
         Object to test (log/trace)
     parameters
-        Possible parameters of the algorithm
+        Possible parameters of the algorithm, including n_jobs (number of threads used to represent the traces
+        of large logs, 1 by default)
 
     Returns
     -------------
@@ -318,7 +538,9 @@ def test(model, obj, parameters=None):
     """
     if parameters is None:
         parameters = {}
+    n_jobs = parameters["n_jobs"] if "n_jobs" in parameters else 1
     feature_names = model["feature_names"]
+    features_encoding = model["features_encoding"] if "features_encoding" in model else None
     regr = model["regr"]
     max_len_trace = model["max_len_trace"]
     log_max_value = model["log_max_value"]
@@ -326,12 +548,11 @@ def test(model, obj, parameters=None):
         log = obj
     else:
         log = EventLog([obj])
-    X = get_X_from_log(log, feature_names, max_len_trace)
+    X = get_X_from_log(log, feature_names, max_len_trace, features_encoding=features_encoding, n_jobs=n_jobs)
     y = regr.predict(X)
     if len(log) == 1:
         return reconstruct_value(y[0][len(log[0]) - 1], log_max_value)
     else:
-        ret = []
-        for index, trace in enumerate(log):
-            ret.append(reconstruct_value(y[index][len(trace) - 1], log_max_value))
-        return ret
+        # for each trace, the prediction associated to its last event
+        last_indexes = np.array([len(trace) - 1 for trace in log], dtype=np.int64)
+        return reconstruct_value_vec(y[np.arange(len(log)), last_indexes], log_max_value).tolist()